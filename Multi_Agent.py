@@ -1,24 +1,32 @@
 import os
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
-from typing import Literal, Annotated, Sequence
+from typing import Literal, Annotated, Sequence, Optional
 from typing_extensions import TypedDict
 from langgraph.graph import MessagesState, START, END, StateGraph, add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.types import Command
-from SQL_Query_Agent import nl2sql_tool
-from RAG_Agent import retriever_tool
+from SQL_Query_Agent import nl2sql_tool, get_table_info, db
+from RAG_Agent import retriever_tool, retrieve
 from WebSearch_Agent import web_search_tool_func
 from langchain_core.messages import BaseMessage, HumanMessage
+from prefetch import SpeculativePrefetch, activate
+from llm_cache import install_llm_cache, must_propagate
 
 
 load_dotenv()
 
+# Disk cache for every LLM call made by the agents (LLM_CACHE_MODE, off by default)
+install_llm_cache()
+
 api_key = os.getenv("OPENAI_API_KEY")
 model = os.getenv("OPENAI_MODEL")
 
 llm = ChatOpenAI(model=model, api_key=api_key)
 
+# Start cheap, side-effect-free tool work in parallel with the first supervisor call
+speculative_prefetch = os.getenv("SPECULATIVE_PREFETCH", "false").lower() in ("1", "true", "yes")
+
 
 # Define available agents
 members = ["web_researcher", "rag", "nl2sql"]
@@ -44,12 +52,33 @@ class Router(TypedDict):
     next: Literal["web_researcher", "rag", "nl2sql", "FINISH"]
 
 
+# Graph state: the conversation plus the request's speculative prefetch, if any
+class SupervisorState(MessagesState):
+    prefetch: Optional[SpeculativePrefetch]
+
+
+def start_prefetch(question: str) -> SpeculativePrefetch:
+    """Retrieve from the knowledge base and load the SQL schema before routing is known."""
+    prefetch = SpeculativePrefetch()
+    prefetch.start("rag", question, lambda: retrieve(question))
+    if db is not None:
+        prefetch.start("nl2sql_schema", "", get_table_info)
+    return prefetch
+
+
 # Define supervisor node function to route the conversation to the appropriate agent
-def supervisor_node(state: MessagesState) -> Command[Literal["web_researcher", "rag", "nl2sql", "__end__"]]:
+def supervisor_node(state: SupervisorState) -> Command[Literal["web_researcher", "rag", "nl2sql", "__end__"]]:
     messages = [
         {"role": "system", "content": system_prompt},
     ] + state["messages"]
     
+    # Only the first supervisor call of a request starts prefetching
+    update = {}
+    prefetch = state.get("prefetch")
+    if prefetch is None and speculative_prefetch:
+        prefetch = start_prefetch(state["messages"][-1].content)
+        update["prefetch"] = prefetch
+    
     try:
         response = llm.with_structured_output(Router).invoke(messages)
         goto = response["next"]
@@ -58,10 +87,17 @@ def supervisor_node(state: MessagesState) -> Command[Literal["web_researcher", "
         if goto == "FINISH":
             goto = END
         
-        return Command(goto=goto)
+        if goto == END and prefetch is not None:
+            prefetch.close()
+        return Command(goto=goto, update=update)
     except Exception as e:
         print(f"Error in supervisor: {str(e)}")
-        return Command(goto=END)
+        if prefetch is not None:
+            prefetch.close()
+        # A drifted LLM cache recording must fail the run, not end it quietly
+        if must_propagate(e):
+            raise
+        return Command(goto=END, update=update)
 
 
 #------------------------------------------------Agent Container for all Specialised Agents------------------------------------------------------#
@@ -99,7 +135,7 @@ def create_agent(llm, tools):
 # Create web search agent
 websearch_agent = create_agent(llm, [web_search_tool_func])
 
-def web_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
+def web_research_node(state: SupervisorState) -> Command[Literal["supervisor"]]:
     try:
         result = websearch_agent.invoke(state)
         return Command(
@@ -111,6 +147,8 @@ def web_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
             goto="supervisor",
         )
     except Exception as e:
+        if must_propagate(e):
+            raise
         return Command(
             update={
                 "messages": [
@@ -126,9 +164,10 @@ def web_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
 # Create rag agent
 rag_agent = create_agent(llm, [retriever_tool])
 
-def rag_node(state: MessagesState) -> Command[Literal["supervisor"]]:
+def rag_node(state: SupervisorState) -> Command[Literal["supervisor"]]:
     try:
-        result = rag_agent.invoke(state)
+        with activate(state.get("prefetch")):
+            result = rag_agent.invoke(state)
         return Command(
             update={
                 "messages": [
@@ -138,6 +177,8 @@ def rag_node(state: MessagesState) -> Command[Literal["supervisor"]]:
             goto="supervisor",
         )
     except Exception as e:
+        if must_propagate(e):
+            raise
         return Command(
             update={
                 "messages": [
@@ -153,9 +194,10 @@ def rag_node(state: MessagesState) -> Command[Literal["supervisor"]]:
 # Create sql query agent
 nl2sql_agent = create_agent(llm, [nl2sql_tool])
 
-def nl2sql_node(state: MessagesState) -> Command[Literal["supervisor"]]:
+def nl2sql_node(state: SupervisorState) -> Command[Literal["supervisor"]]:
     try:
-        result = nl2sql_agent.invoke(state)
+        with activate(state.get("prefetch")):
+            result = nl2sql_agent.invoke(state)
         return Command(
             update={
                 "messages": [
@@ -165,6 +207,8 @@ def nl2sql_node(state: MessagesState) -> Command[Literal["supervisor"]]:
             goto="supervisor",
         )
     except Exception as e:
+        if must_propagate(e):
+            raise
         return Command(
             update={
                 "messages": [
@@ -177,7 +221,7 @@ def nl2sql_node(state: MessagesState) -> Command[Literal["supervisor"]]:
 
 #------------------------------------------------Building Structure of the Workflow------------------------------------------------------#
 
-builder = StateGraph(MessagesState)
+builder = StateGraph(SupervisorState)
 builder.add_edge(START, "supervisor")
 builder.add_node("supervisor", supervisor_node)
 builder.add_node("web_researcher", web_research_node)
@@ -203,6 +247,8 @@ def run_agent(question: str):
             print("----")
     except Exception as e:
         print(f"Error running agent: {str(e)}")
+        if must_propagate(e):
+            raise
 
 
 if __name__ == "__main__":
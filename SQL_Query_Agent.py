@@ -4,14 +4,16 @@ import urllib.request
 import hashlib
 import json
 from datetime import datetime, timedelta
-from langchain.chains import create_sql_query_chain
+from langchain.chains.sql_database.prompt import SQL_PROMPTS, PROMPT
 from langchain_openai import ChatOpenAI
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
 from pydantic import BaseModel
 from langchain.tools import tool
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_community.utilities import SQLDatabase
+from prefetch import lookup
+from llm_cache import must_propagate
+from sql_results import sql_result_store, execute
 
 
 def ensure_chinook_db():
@@ -45,6 +47,23 @@ else:
 llm = ChatOpenAI(model="gpt-4o")
 
 
+def get_table_info() -> str:
+    """Schema and sample rows of every table, as shown to the LLM for SQL generation."""
+    return db.get_table_info()
+
+
+def create_write_query_chain(llm, db, k=5):
+    """Equivalent of create_sql_query_chain that takes table_info as an input.
+
+    create_sql_query_chain always fetches the schema itself; taking it as an
+    input lets nl2sql_tool use a schema that was prefetched speculatively.
+    """
+    prompt = SQL_PROMPTS.get(db.dialect, PROMPT)
+    if "dialect" in prompt.input_variables:
+        prompt = prompt.partial(dialect=db.dialect)
+    return prompt.partial(top_k=str(k)) | llm.bind(stop=["\nSQLResult:"]) | StrOutputParser()
+
+
 # Query Cache Implementation
 class QueryCache:
     def __init__(self, cache_file="query_cache.json", max_age_hours=24):
@@ -133,6 +152,8 @@ def explain_sql_query(query: str) -> str:
         explanation = explanation_chain.invoke({"query": query})
         return f"\n🔍 **Query Explanation:**\n{explanation}\n"
     except Exception as e:
+        if must_propagate(e):
+            raise
         return f"\n⚠️ Could not generate query explanation: {str(e)}\n"
 
 
@@ -192,38 +213,52 @@ class SQLToolSchema(BaseModel):
     question: str
 
 
-@tool(args_schema=SQLToolSchema)
+def format_sql_result(summary: dict) -> str:
+    """Compact JSON view of a stored result for the LLM: never more than the preview rows."""
+    return json.dumps(
+        {key: summary[key] for key in ("columns", "row_count", "truncated", "preview", "aggregates")},
+        default=str
+    )
+
+
+# content goes to the LLM; the artifact (result id) stays out of the prompt and reaches the API
+@tool(args_schema=SQLToolSchema, response_format="content_and_artifact")
 def nl2sql_tool(question):
     """Tool to Generate and Execute SQL Query to answer User Questions related to chinook DB"""
     print("INSIDE NL2SQL TOOL")
     
     if db is None:
-        return "Error: Database connection not available. Please ensure Chinook.db is properly set up."
+        return "Error: Database connection not available. Please ensure Chinook.db is properly set up.", None
     
-    # Check cache first
+    # Check cache first; the full result it points to may have been evicted since
     cached_result = query_cache.get(question)
-    if cached_result:
-        return cached_result
+    if isinstance(cached_result, dict) and sql_result_store.exists(cached_result["result_id"]):
+        return cached_result["content"], {"sql_result_id": cached_result["result_id"]}
     
     try:
-        execute_query = QuerySQLDataBaseTool(db=db)
-        write_query = create_sql_query_chain(llm, db)
+        write_query = create_write_query_chain(llm, db)
+
+        # The schema may already have been fetched speculatively while the supervisor was routing
+        table_info = lookup("nl2sql_schema", "", get_table_info)
 
         # Generate the SQL query
-        raw_query = write_query.invoke({"question": question})
+        raw_query = write_query.invoke({"input": question + "\nSQLQuery: ", "table_info": table_info})
         cleaned_query = clean_sql_query(raw_query)
         
         # Generate explanation for the query
         explanation = explain_sql_query(cleaned_query)
         
-        # Execute the query
-        result = execute_query.invoke(cleaned_query)
+        # Execute the query; the full result set is written to disk, only a summary comes back
+        summary = execute(db._engine, cleaned_query, sql_result_store)
+        shown = len(summary["preview"])
         
         # Format the final response
         final_response = f"""{explanation}
 
-📊 **Query Results:**
-{result}
+📊 **Query Results:** {summary['row_count']} rows{' (truncated)' if summary['truncated'] else ''}, first {shown} shown. The user sees the full result as a table.
+```json
+{format_sql_result(summary)}
+```
 
 🔧 **SQL Query Used:**
 ```sql
@@ -232,10 +267,12 @@ def nl2sql_tool(question):
 """
         
         # Cache the result
-        query_cache.set(question, final_response)
+        query_cache.set(question, {"content": final_response, "result_id": summary["result_id"]})
         
-        return final_response
+        return final_response, {"sql_result_id": summary["result_id"]}
         
     except Exception as e:
+        if must_propagate(e):
+            raise
         error_msg = f"Error executing SQL query: {str(e)}"
-        return error_msg
+        return error_msg, None
@@ -1,13 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Header, Depends, Request
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uuid
+import os
+import hmac
 from datetime import datetime
 import logging
 
 # multi-agent system
 from Multi_Agent import graph
+from prefetch import prefetch_stats
+import llm_cache
+from sql_results import sql_result_store
+from profiling import profiler
+import RAG_Agent
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +33,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Background watcher that indexes added/modified/deleted files in ./docs
+document_watcher = None
+
+@app.on_event("startup")
+async def start_document_watcher():
+    """Start watching ./docs so new documents are indexed without a restart."""
+    global document_watcher
+    # Runs in one worker only (file lock); the others reopen the store when it changes
+    if os.getenv("DOCS_WATCH", "true").lower() in ("1", "true", "yes"):
+        document_watcher = RAG_Agent.start_document_watcher()
+        if document_watcher is not None:
+            logger.info(f"Watching {RAG_Agent.folder_path} for document changes")
+
+@app.on_event("shutdown")
+async def stop_document_watcher():
+    if document_watcher is not None:
+        document_watcher.stop()
+
+@app.on_event("startup")
+async def start_profiling_monitors():
+    """Record GC pauses and event loop stalls for request traces (PROFILING, on by default)."""
+    profiler.install()
+
+@app.on_event("shutdown")
+async def stop_profiling_monitors():
+    profiler.uninstall()
+
+def _admin_token_valid(token: Optional[str]) -> bool:
+    admin_token = os.getenv("ADMIN_TOKEN")
+    return bool(admin_token and token and hmac.compare_digest(token, admin_token))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Guard for /admin endpoints: disabled unless ADMIN_TOKEN is set, then the X-Admin-Token header must match."""
+    if not os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.")
+    if not _admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 # In-memory storage for chat sessions (use a database in production)
 chat_sessions: Dict[str, List[Dict[str, Any]]] = {}
 
@@ -39,6 +86,8 @@ class ChatResponse(BaseModel):
     timestamp: str
     agents_used: List[str]
     message_id: str
+    # Ids for GET /sql-results/{result_id}, one per executed SQL query
+    sql_results: List[str] = []
 
 # Chat history model
 class ChatHistory(BaseModel):
@@ -66,7 +115,11 @@ async def root():
             "chat": "/chat",
             "capabilities": "/capabilities",
             "history": "/history/{session_id}",
-            "sessions": "/sessions"
+            "sessions": "/sessions",
+            "sql_results": "/sql-results/{result_id}?offset=0&limit=50",
+            "embedding_metrics": "/metrics/embeddings",
+            "prefetch_metrics": "/metrics/prefetch",
+            "llm_cache_metrics": "/metrics/llm-cache"
         }
     }
 
@@ -75,10 +128,53 @@ async def get_capabilities():
     """Get information about agent capabilities."""
     return AgentCapabilities()
 
+def _run_graph(message: str, session_id: str, trace=None):
+    """Run the multi-agent graph for one message; returns (response_content, agents_used, sql_results)."""
+    agents_used = []
+    sql_results = []
+    response_content = ""
+    logger.info(f"Processing message for session {session_id}: {message[:100]}...")
+    
+    # Capture the multi-agent system output
+    for s in graph.stream(
+        {"messages": [("user", message)]}, 
+        # The request trace records node, LLM and tool spans through the callback system
+        {"callbacks": [trace]} if trace is not None else None,
+        subgraphs=True
+    ):
+        # With subgraphs=True each item is (namespace, update); namespace is () for the top-level graph
+        namespace, update = s if isinstance(s, tuple) else ((), s)
+        if not isinstance(update, dict):
+            continue
+        for key, value in update.items():
+            messages = value.get("messages", []) if isinstance(value, dict) else []
+            if not namespace:
+                # Extract agent information from the stream
+                if key in ["web_researcher", "rag", "nl2sql"] and key not in agents_used:
+                    agents_used.append(key)
+                    logger.info(f"Agent {key} activated for session {session_id}")
+                # The latest worker message is the answer once the supervisor finishes
+                if messages and hasattr(messages[-1], 'content'):
+                    response_content = messages[-1].content
+            # Full SQL results stay on disk; the tool passes their ids as message artifacts
+            for msg in messages:
+                artifact = getattr(msg, "artifact", None)
+                if isinstance(artifact, dict) and artifact.get("sql_result_id"):
+                    sql_results.append(artifact["sql_result_id"])
+    
+    # Fallback: if no content extracted, provide a general response
+    if not response_content:
+        response_content = "I've processed your request using my specialized agents. How else can I help you?"
+        logger.warning(f"No response content extracted for session {session_id}")
+    
+    return response_content, agents_used, sql_results
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(chat_message: ChatMessage):
+async def chat(chat_message: ChatMessage, request: Request):
     """
     Main chat endpoint that processes user messages using the multi-agent system.
+    
+    Admins can sample a single request with the headers X-Profile: 1 and X-Admin-Token.
     """
     try:
         # Generate session ID if not provided
@@ -101,47 +197,32 @@ async def chat(chat_message: ChatMessage):
         
         # Process the message through the multi-agent system
         agents_used = []
-        response_content = ""
+        sql_results = []
+        
+        profile_requested = (
+            request.headers.get("x-profile", "").lower() in ("1", "true", "yes")
+            and _admin_token_valid(request.headers.get("x-admin-token"))
+        )
+        trace = profiler.start_trace(f"POST /chat {session_id}", sample=profile_requested)
         
         try:
-            logger.info(f"Processing message for session {session_id}: {chat_message.message[:100]}...")
-            
-            # Capture the multi-agent system output
-            responses = []
-            for s in graph.stream(
-                {"messages": [("user", chat_message.message)]}, 
-                subgraphs=True
-            ):
-                responses.append(s)
-                # Extract agent information from the stream
-                if isinstance(s, dict):
-                    for key, value in s.items():
-                        if key in ["web_researcher", "rag", "nl2sql"] and key not in agents_used:
-                            agents_used.append(key)
-                            logger.info(f"Agent {key} activated for session {session_id}")
-            
-            # Extract the final response from the last agent
-            if responses:
-                last_response = responses[-1]
-                if isinstance(last_response, dict):
-                    # Try to extract the content from the last response
-                    for key, value in last_response.items():
-                        if isinstance(value, dict) and "messages" in value:
-                            if value["messages"] and len(value["messages"]) > 0:
-                                last_message = value["messages"][-1]
-                                if hasattr(last_message, 'content'):
-                                    response_content = last_message.content
-                                elif isinstance(last_message, dict) and 'content' in last_message:
-                                    response_content = last_message['content']
-            
-            # Fallback: if no content extracted, provide a general response
-            if not response_content:
-                response_content = "I've processed your request using my specialized agents. How else can I help you?"
-                logger.warning(f"No response content extracted for session {session_id}")
-                
+            # The graph is synchronous (LLM calls, retrieval, SQL); run it in the
+            # threadpool so concurrent requests are not serialized on the event loop
+            response_content, agents_used, sql_results = await run_in_threadpool(
+                _run_graph, chat_message.message, session_id, trace
+            )
         except Exception as e:
+            # Replays must fail loudly (HTTP 500) rather than return a fallback answer
+            if llm_cache.must_propagate(e):
+                raise
             logger.error(f"Error in multi-agent processing for session {session_id}: {str(e)}", exc_info=True)
             response_content = f"I encountered an issue while processing your request. Please try rephrasing your question or try again."
+        finally:
+            if profiler.finish(trace):
+                logger.warning(
+                    f"Captured {trace.reason} trace {trace.id} for session {session_id} "
+                    f"({1000 * trace.duration:.0f} ms), see /admin/profiling"
+                )
         
         # Add assistant response to session history
         assistant_message = {
@@ -149,7 +230,8 @@ async def chat(chat_message: ChatMessage):
             "role": "assistant",
             "content": response_content,
             "timestamp": datetime.now().isoformat(),
-            "agents_used": agents_used
+            "agents_used": agents_used,
+            "sql_results": sql_results
         }
         chat_sessions[session_id].append(assistant_message)
         
@@ -158,7 +240,8 @@ async def chat(chat_message: ChatMessage):
             session_id=session_id,
             timestamp=timestamp,
             agents_used=agents_used,
-            message_id=message_id
+            message_id=message_id,
+            sql_results=sql_results
         )
         
     except Exception as e:
@@ -198,6 +281,75 @@ async def delete_session(session_id: str):
     del chat_sessions[session_id]
     return {"message": f"Session {session_id} deleted successfully"}
 
+@app.get("/sql-results/{result_id}")
+async def get_sql_result(result_id: str, offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    """One page of a stored SQL result set."""
+    try:
+        return await run_in_threadpool(sql_result_store.page, result_id, offset, limit)
+    except (KeyError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="SQL result not found or expired")
+
+@app.get("/sql-results/{result_id}/csv")
+async def download_sql_result(result_id: str):
+    """The complete SQL result set as CSV."""
+    try:
+        path = sql_result_store.csv_path(result_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="SQL result not found or expired")
+    return FileResponse(path, media_type="text/csv", filename=f"sql_result_{result_id}.csv")
+
+@app.get("/metrics/embeddings")
+async def embedding_metrics():
+    """Queue depth and batching statistics of the query embedding executor."""
+    if RAG_Agent.embedding_function is None:
+        return {"enabled": False}
+    return {"enabled": True, **RAG_Agent.embedding_function.stats()}
+
+@app.get("/metrics/prefetch")
+async def prefetch_metrics():
+    """Hit rate and latency saved by speculative tool prefetching (SPECULATIVE_PREFETCH=true)."""
+    return prefetch_stats.snapshot()
+
+@app.get("/metrics/llm-cache")
+async def llm_cache_metrics():
+    """Size and hit rate of the disk LLM cache (LLM_CACHE_MODE)."""
+    if llm_cache.llm_cache is None:
+        return {"mode": "off"}
+    return llm_cache.llm_cache.stats()
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    """Profiler settings, the current profiling window and the captured traces, newest first."""
+    return profiler.status()
+
+@app.post("/admin/profiling/window", dependencies=[Depends(require_admin)])
+async def start_profiling_window(seconds: float = Query(60, gt=0, le=600)):
+    """Sample and keep every /chat request that starts in the next `seconds`."""
+    profiler.start_window(seconds)
+    return {"window_remaining_s": round(profiler.window_remaining(), 1)}
+
+@app.delete("/admin/profiling/window", dependencies=[Depends(require_admin)])
+async def stop_profiling_window():
+    profiler.start_window(0)
+    return {"window_remaining_s": 0}
+
+@app.get("/admin/profiling/traces/{trace_id}", dependencies=[Depends(require_admin)])
+async def download_trace(trace_id: str):
+    """A captured trace as speedscope JSON; open it at https://www.speedscope.app."""
+    trace = profiler.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found or rotated out of the buffer")
+    content = await run_in_threadpool(trace.to_speedscope)
+    return JSONResponse(
+        content,
+        headers={"Content-Disposition": f'attachment; filename="trace_{trace_id}.speedscope.json"'}
+    )
+
+@app.delete("/admin/profiling/traces", dependencies=[Depends(require_admin)])
+async def clear_traces():
+    profiler.clear()
+    return {"message": "Traces cleared"}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -0,0 +1,173 @@
+"""Compare the RAG embedding backends on our own corpus.
+
+Usage (from the project root):
+    python -m benchmarks.embedding_backends --docs ./docs
+    python -m benchmarks.embedding_backends --backends torch,onnx-int8 --queries queries.txt
+
+For every backend in embedding_service.EMBEDDING_BACKENDS it reports:
+- load time and peak RSS of a fresh process that loads the model and embeds the corpus
+- ingestion throughput (chunks/s through embed_documents)
+- single-query latency p50/p95 and batched query throughput (queries/s)
+- recall@k: fraction of queries whose source chunk is in the top k, when queries are
+  generated from the corpus (the first sentence of a sampled chunk)
+- overlap@k: agreement of the top k with the torch fp32 baseline, which is the number
+  that tells you how much a quantized or distilled model changes retrieval
+
+Each backend runs in its own process so memory numbers are not polluted by the others.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import re
+import resource
+import statistics
+import time
+
+import numpy as np
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 250
+
+
+def load_chunks(folder_path):
+    """Load and split ./docs the same way RAG_Agent does."""
+    from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    documents = []
+    for filename in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, filename)
+        if filename.endswith('.pdf'):
+            documents.extend(PyPDFLoader(file_path).load())
+        elif filename.endswith('.docx'):
+            documents.extend(Docx2txtLoader(file_path).load())
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return [doc.page_content for doc in text_splitter.split_documents(documents)]
+
+
+def make_queries(chunks, sample_size, seed):
+    """Use the first sentence of sampled chunks as queries; the chunk is the expected hit."""
+    rng = random.Random(seed)
+    indices = rng.sample(range(len(chunks)), min(sample_size, len(chunks)))
+    queries, expected = [], []
+    for i in indices:
+        sentence = re.split(r"(?<=[.!?])\s+", chunks[i].strip(), maxsplit=1)[0][:300]
+        if len(sentence) >= 20:
+            queries.append(sentence)
+            expected.append(i)
+    return queries, expected
+
+
+def run_backend(backend, chunks, queries, k, result_queue):
+    """Measure one backend; runs in a child process."""
+    from embedding_service import create_embeddings
+
+    started = time.perf_counter()
+    embeddings = create_embeddings(backend)
+    embeddings.embed_query("warm up")
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    doc_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    ingest_seconds = time.perf_counter() - started
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    batch_seconds = time.perf_counter() - started
+
+    # The multi-qa *-dot-v1 models are trained for dot-product scoring
+    scores = query_vectors @ doc_vectors.T
+    top_k = np.argsort(-scores, axis=1)[:, :k]
+
+    latencies.sort()
+    result_queue.put({
+        "backend": backend,
+        "load_s": load_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "ingest_chunks_per_s": len(chunks) / ingest_seconds,
+        "query_p50_ms": 1000 * statistics.median(latencies),
+        "query_p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        "batch_queries_per_s": len(queries) / batch_seconds,
+        "top_k": top_k.tolist(),
+    })
+
+
+def main():
+    from embedding_service import EMBEDDING_BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default="./docs", help="Folder with the PDF/DOCX corpus")
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS), help="Comma-separated backends")
+    parser.add_argument("--queries", help="Optional file with one query per line (recall@k is then skipped)")
+    parser.add_argument("--sample", type=int, default=200, help="Number of generated queries")
+    parser.add_argument("-k", type=int, default=3, help="Retrieval depth, RAG_Agent uses 3")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.docs)
+    if not chunks:
+        raise SystemExit(f"No PDF or DOCX content found in {args.docs}")
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+        expected = None
+    else:
+        queries, expected = make_queries(chunks, args.sample, args.seed)
+    print(f"Corpus: {len(chunks)} chunks, {len(queries)} queries, k={args.k}")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # baseline for overlap@k
+
+    # spawn: the children must not inherit a model loaded by an earlier run
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for backend in backends:
+        result_queue = context.Queue()
+        process = context.Process(target=run_backend, args=(backend, chunks, queries, args.k, result_queue))
+        process.start()
+        while True:
+            try:
+                results[backend] = result_queue.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    print(f"{backend}: failed (exit code {process.exitcode})")
+                    break
+        process.join()
+
+    baseline = results.get("torch")
+    header = f"{'backend':<11}{'load s':>8}{'peak MB':>9}{'chunks/s':>10}{'p50 ms':>8}{'p95 ms':>8}{'batch q/s':>10}{'recall@k':>10}{'overlap@k':>11}"
+    print(header)
+    print("-" * len(header))
+    for backend, r in results.items():
+        recall = "-"
+        if expected is not None:
+            recall = f"{np.mean([e in top for e, top in zip(expected, r['top_k'])]):.3f}"
+        overlap = "-"
+        if baseline is not None:
+            overlap = f"{np.mean([len(set(a) & set(b)) / args.k for a, b in zip(r['top_k'], baseline['top_k'])]):.3f}"
+        print(
+            f"{backend:<11}{r['load_s']:>8.1f}{r['peak_rss_mb']:>9.0f}{r['ingest_chunks_per_s']:>10.1f}"
+            f"{r['query_p50_ms']:>8.1f}{r['query_p95_ms']:>8.1f}{r['batch_queries_per_s']:>10.1f}"
+            f"{recall:>10}{overlap:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Compare the Chroma and HNSW vector store backends at large corpus sizes.
+
+Usage (from the project root):
+    python -m benchmarks.vector_backends --sizes 100000,1000000,5000000
+    python -m benchmarks.vector_backends --sizes 100000 --backends hnsw --ef-search 32,64,128
+
+Synthetic unit vectors (768 dimensions, like multi-qa-mpnet-base-dot-v1) with
+file/page metadata stand in for embedded chunks; queries are noisy copies of
+corpus vectors so they have real nearest neighbours. For each backend and size:
+- build time (upsert in batches, then flush)
+- RSS of a fresh serving process after opening the store and after the queries
+- query latency p50/p99 for k=3, unfiltered and filtered by file
+- recall@k against exact brute-force search
+
+Build and serve run in separate processes so RSS reflects what a server pays to
+serve an existing index. Expect long build times for Chroma at 5M vectors.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+BLOCK = 50000
+FILES = 1000
+
+
+def vector_block(block, size, dim, seed):
+    """Deterministic block of unit vectors, so every process sees the same corpus."""
+    count = min(BLOCK, size - block * BLOCK)
+    vectors = np.random.default_rng([seed, block]).standard_normal((count, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(size, dim, count, seed):
+    rng = np.random.default_rng([seed, 1 << 30])
+    targets = rng.integers(0, size, count)
+    queries = np.stack([vector_block(t // BLOCK, size, dim, seed)[t % BLOCK] for t in targets])
+    queries += 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def metadata(i):
+    return {"source": f"./docs/doc{i % FILES}.pdf", "file": f"doc{i % FILES}.pdf", "page": (i // FILES) % 50, "chunk": 0}
+
+
+def brute_force(queries, size, dim, seed, k):
+    """Exact top-k by inner product, streamed over the corpus."""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for block in range((size + BLOCK - 1) // BLOCK):
+        scores = queries @ vector_block(block, size, dim, seed).T
+        ids = np.broadcast_to(np.arange(block * BLOCK, block * BLOCK + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argsort(-scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+
+def open_store(backend, directory, ef_search):
+    from vector_store import ChromaVectorStore, HNSWVectorStore
+
+    if backend == "chroma":
+        # Vectors are passed in directly, so no embedding function is needed
+        return ChromaVectorStore("benchmark", None, directory)
+    return HNSWVectorStore(directory, expansion_search=ef_search)
+
+
+def rss_mb(field="VmRSS"):
+    """Current (VmRSS) or peak (VmHWM) resident memory of this process.
+
+    VmHWM rather than ru_maxrss: the latter survives exec, so a spawned child
+    would report the parent's peak from the brute-force search.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def build(backend, directory, size, dim, seed, result_queue):
+    store = open_store(backend, directory, 64)
+    started = time.perf_counter()
+    batch = 5000  # below Chroma's maximum batch size
+    for block in range((size + BLOCK - 1) // BLOCK):
+        vectors = vector_block(block, size, dim, seed)
+        for offset in range(0, len(vectors), batch):
+            first = block * BLOCK + offset
+            ids = list(range(first, first + len(vectors[offset:offset + batch])))
+            store.upsert(
+                [f"v{i}" for i in ids],
+                vectors[offset:offset + batch],
+                [f"chunk {i}" for i in ids],
+                [metadata(i) for i in ids]
+            )
+    store.flush()
+    result_queue.put({"build_s": time.perf_counter() - started})
+
+
+def serve(backend, directory, queries, k, ef_search, result_queue):
+    store = open_store(backend, directory, ef_search)
+    store.search(queries[0], k)  # open lazy handles
+    rss_open = rss_mb()
+
+    def run(file_filter):
+        latencies, found = [], []
+        for i, query in enumerate(queries):
+            file = f"doc{i % FILES}.pdf" if file_filter else None
+            started = time.perf_counter()
+            results = store.search(query, k, file=file)
+            latencies.append(time.perf_counter() - started)
+            found.append([int(doc.page_content.split()[1]) for doc, _ in results])
+        latencies.sort()
+        return latencies, found
+
+    latencies, found = run(False)
+    filtered_latencies, _ = run(True)
+    result_queue.put({
+        "rss_open_mb": rss_open,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": rss_mb("VmHWM"),
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+        "filtered_p50_ms": 1000 * statistics.median(filtered_latencies),
+        "filtered_p99_ms": 1000 * filtered_latencies[int(0.99 * (len(filtered_latencies) - 1))],
+        "found": found,
+    })
+
+
+def run_in_process(context, target, *args):
+    result_queue = context.Queue()
+    process = context.Process(target=target, args=(*args, result_queue))
+    process.start()
+    while True:
+        try:
+            result = result_queue.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                result = None
+                break
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100000,1000000,5000000", help="Comma-separated corpus sizes")
+    parser.add_argument("--backends", default="chroma,hnsw", help="Comma-separated backends")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=3, help="Retrieval depth, RAG_Agent uses 3")
+    parser.add_argument("--ef-search", default="64", help="Comma-separated HNSW expansion_search values")
+    parser.add_argument("--workdir", help="Where to build the stores (default: a temporary directory)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="vector_bench_")
+    header = (f"{'backend':<16}{'size':>10}{'build s':>10}{'rss open':>10}{'rss':>8}{'peak':>8}"
+              f"{'p50 ms':>8}{'p99 ms':>8}{'filt p50':>10}{'filt p99':>10}{'recall':>8}")
+    print(header)
+    print("-" * len(header))
+
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            queries = make_queries(size, args.dim, args.queries, args.seed)
+            truth = brute_force(queries, size, args.dim, args.seed, args.k)
+            for backend in [b.strip() for b in args.backends.split(",")]:
+                directory = os.path.join(workdir, f"{backend}_{size}")
+                built = run_in_process(context, build, backend, directory, size, args.dim, args.seed)
+                if built is None:
+                    print(f"{backend:<16}{size:>10}  build failed")
+                    continue
+                ef_values = [int(ef) for ef in args.ef_search.split(",")] if backend == "hnsw" else [0]
+                for ef in ef_values:
+                    r = run_in_process(context, serve, backend, directory, queries, args.k, ef)
+                    label = f"{backend} ef={ef}" if backend == "hnsw" else backend
+                    if r is None:
+                        print(f"{label:<16}{size:>10}  serve failed")
+                        continue
+                    recall = np.mean([len(set(found) & set(expected.tolist())) / args.k
+                                      for found, expected in zip(r["found"], truth)])
+                    print(
+                        f"{label:<16}{size:>10}{built['build_s']:>10.1f}{r['rss_open_mb']:>10.0f}{r['rss_mb']:>8.0f}"
+                        f"{r['peak_rss_mb']:>8.0f}{r['p50_ms']:>8.2f}{r['p99_ms']:>8.2f}"
+                        f"{r['filtered_p50_ms']:>10.2f}{r['filtered_p99_ms']:>10.2f}{recall:>8.3f}"
+                    )
+                shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
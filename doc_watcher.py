@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class DocumentWatcher:
+    """Poll a folder and report added, modified and deleted documents.
+
+    Polling (stat of every file each ``interval`` seconds) works the same on every
+    platform and filesystem, including bind mounts where inotify events are lost.
+    A change is only reported once the file's size and mtime have been stable for
+    ``debounce`` seconds, so a file that is still being copied, or a burst of
+    saves, results in a single update. A handler that raises is retried with
+    exponential backoff, from ``debounce`` up to ``max_retry_delay`` seconds,
+    until it succeeds or the file changes again, so an unreadable file is not
+    re-parsed every few seconds.
+
+    ``indexed`` maps each path to the (mtime_ns, size) signature it was indexed
+    with; files missing from it or with another signature are indexed, paths
+    no longer in the folder are deleted. Defaults to the folder as it is now.
+    """
+
+    def __init__(
+        self,
+        folder_path: str,
+        extensions: Tuple[str, ...],
+        on_change: Callable[[str], int],
+        on_delete: Callable[[str], int],
+        interval: float = 2.0,
+        debounce: float = 3.0,
+        indexed: Optional[Dict[str, Optional[tuple]]] = None,
+        max_retry_delay: float = 600.0,
+    ):
+        self.folder_path = folder_path
+        self.extensions = extensions
+        self.on_change = on_change
+        self.on_delete = on_delete
+        self.interval = interval
+        self.debounce = debounce
+        self.max_retry_delay = max_retry_delay
+        # Signature (mtime, size) of each file as last indexed
+        self._indexed = dict(indexed) if indexed is not None else self._scan()
+        # path -> (signature seen, time it was first seen); signature None means deleted
+        self._pending: Dict[str, Tuple[Optional[tuple], float]] = {}
+        # path -> (signature that failed, consecutive failures)
+        self._failures: Dict[str, Tuple[Optional[tuple], int]] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _scan(self) -> Dict[str, tuple]:
+        snapshot = {}
+        try:
+            entries = list(os.scandir(self.folder_path))
+        except FileNotFoundError:
+            return snapshot
+        for entry in entries:
+            if entry.name.endswith(self.extensions) and not entry.name.startswith(('.', '~$')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[os.path.join(self.folder_path, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        """Run one scan and apply every change that has settled."""
+        current = self._scan()
+        now = time.monotonic()
+        changed = {path for path, signature in current.items() if self._indexed.get(path) != signature}
+        changed |= set(self._indexed) - set(current)
+
+        # A file that went back to its indexed state needs nothing
+        for path in set(self._pending) - changed:
+            del self._pending[path]
+            self._failures.pop(path, None)
+
+        for path in sorted(changed):
+            signature = current.get(path)
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != signature:
+                self._pending[path] = (signature, now)
+                continue
+            if now - pending[1] < self.debounce:
+                continue
+
+            started = time.perf_counter()
+            try:
+                if signature is None:
+                    chunks = self.on_delete(path)
+                    self._indexed.pop(path, None)
+                    print(f"🗑️ Removed {os.path.basename(path)} from the index ({chunks} chunks)")
+                else:
+                    chunks = self.on_change(path)
+                    self._indexed[path] = signature
+                    print(f"🔄 Indexed {os.path.basename(path)} ({chunks} chunks, {time.perf_counter() - started:.1f}s)")
+                del self._pending[path]
+                self._failures.pop(path, None)
+            except Exception as e:
+                failed_signature, failures = self._failures.get(path, (signature, 0))
+                failures = failures + 1 if failed_signature == signature else 1
+                self._failures[path] = (signature, failures)
+                delay = min(self.debounce * 2 ** failures, self.max_retry_delay)
+                print(f"❌ Error indexing {os.path.basename(path)}, will retry in {delay:.0f}s: {str(e)}")
+                # Due again once the delay is over, unless the file changes first
+                self._pending[path] = (signature, now + delay - self.debounce)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Document watcher error: {str(e)}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="document-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
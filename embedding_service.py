@@ -0,0 +1,129 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
+
+
+# Selectable embedding backends: model name and SentenceTransformer constructor kwargs.
+# The ONNX backends need sentence-transformers>=3.2 with the onnx extra installed.
+EMBEDDING_BACKENDS = {
+    # Full fp32 PyTorch model (default)
+    "torch": ("multi-qa-mpnet-base-dot-v1", {}),
+    # Same model exported to ONNX Runtime, fp32
+    "onnx": ("multi-qa-mpnet-base-dot-v1", {"backend": "onnx"}),
+    # Same model, ONNX with dynamic int8 quantization
+    "onnx-int8": (
+        "multi-qa-mpnet-base-dot-v1",
+        {
+            "backend": "onnx",
+            "model_kwargs": {"file_name": os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")},
+        },
+    ),
+    # Distilled 6-layer model trained on the same Q&A data with dot-product scoring (22M parameters)
+    "distilled": ("multi-qa-MiniLM-L6-dot-v1", {}),
+}
+
+
+def create_embeddings(backend: str = "torch") -> SentenceTransformerEmbeddings:
+    """Create the embedding model for one of the EMBEDDING_BACKENDS."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose from: {', '.join(EMBEDDING_BACKENDS)}")
+    model_name, model_kwargs = EMBEDDING_BACKENDS[backend]
+    return SentenceTransformerEmbeddings(model_name=model_name, model_kwargs=model_kwargs)
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeddings wrapper that runs concurrent query embeddings as one batch.
+
+    Each embed_query call is queued; a dedicated thread takes the first waiting
+    request, keeps collecting for up to ``max_wait_ms`` (or until
+    ``max_batch_size`` requests are waiting) and encodes them with a single
+    ``embed_documents`` call. Under concurrent load this replaces many
+    batch-of-1 forward passes with a few larger ones.
+
+    Queries are encoded with ``embed_documents`` of the wrapped model, which is
+    what SentenceTransformer-based embeddings do for ``embed_query`` anyway.
+    Document embedding (ingestion) is already batched and is passed through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._worker = None
+        # Metrics
+        self._requests = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._encode_seconds = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future = Future()
+        self._ensure_worker().put((text, future))
+        return future.result()
+
+    def _ensure_worker(self) -> queue.Queue:
+        """Start the batching thread, again in a forked child (threads do not survive fork)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            return self._queue
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self._requests += len(batch)
+                    self._batches += 1
+                    self._largest_batch = max(self._largest_batch, len(batch))
+                    self._encode_seconds += time.perf_counter() - started
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        """Queue depth and batching statistics for this process."""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "avg_encode_ms": round(1000 * self._encode_seconds / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
@@ -0,0 +1,83 @@
+"""Production server settings: preload the app once, then fork uvicorn workers.
+
+Run with:
+    gunicorn -c gunicorn.conf.py app:app
+
+Importing ``app`` loads the SentenceTransformer model, indexes ./docs into Chroma
+and connects to Chinook in the master process. Workers are forked afterwards, so
+the model weights are shared copy-on-write instead of being loaded N times.
+Anything that is not fork-safe (Chroma client, SQLite connections) is reopened
+in ``post_fork``.
+"""
+import gc
+import os
+import time
+
+# Forked workers must not inherit a tokenizer thread pool from the master
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# LLM round trips routinely take tens of seconds
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+_config_loaded_at = time.monotonic()
+
+
+def _memory_summary(pid="self"):
+    """RSS, PSS and private memory of a process in MB (Linux only)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return "memory stats unavailable"
+    private_kb = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return (
+        f"rss={fields.get('Rss', 0) / 1024:.0f}MB "
+        f"pss={fields.get('Pss', 0) / 1024:.0f}MB "
+        f"private={private_kb / 1024:.0f}MB"
+    )
+
+
+def when_ready(server):
+    # The app is already imported at this point because of preload_app
+    server.log.info(
+        f"Preloaded app in {time.monotonic() - _config_loaded_at:.1f}s ({_memory_summary()})"
+    )
+    # Move everything allocated during preload out of the collector's reach so
+    # that GC passes in the workers do not touch (and un-share) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+    import RAG_Agent
+    import SQL_Query_Agent
+
+    RAG_Agent.reopen_vectorstore()
+    if SQL_Query_Agent.db is not None:
+        # Drop pooled SQLite connections inherited from the master without closing them
+        SQL_Query_Agent.db._engine.dispose(close=False)
+
+    # Split the cores between workers instead of every worker using all of them
+    threads = int(os.getenv("TORCH_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // workers)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        f"Worker {worker.pid} ready {time.monotonic() - worker.forked_at:.2f}s after fork "
+        f"({_memory_summary()})"
+    )
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+CACHE_MODES = ("off", "readwrite", "record", "replay")
+
+
+class LLMCacheMiss(KeyError):
+    """Raised in replay mode when a prompt was never recorded."""
+
+
+class DiskLLMCache(BaseCache):
+    """LangChain LLM cache stored in a local SQLite file with LRU eviction.
+
+    Installed globally, so it covers every ChatOpenAI call: the supervisor's
+    structured output, the tool-calling agents, SQL generation and query
+    explanations. The key hashes LangChain's llm_string, which holds the model,
+    its parameters and bound tools or response format, and the serialized
+    messages. Entries are zlib-compressed; once the file holds more than
+    ``max_bytes`` of entries, the least recently used ones are evicted.
+
+    Modes:
+    - ``readwrite``: serve hits from the cache, call the API and store on a miss
+    - ``record``: always call the API and store the result (refresh a recording)
+    - ``replay``: serve only from the cache and raise LLMCacheMiss on a miss,
+      so tests and benchmarks never reach the network
+    """
+
+    def __init__(self, path: str = "llm_cache.sqlite", mode: str = "readwrite", max_bytes: int = 256 * 1024 * 1024):
+        if mode not in CACHE_MODES[1:]:
+            raise ValueError(f"Unknown LLM cache mode '{mode}'. Choose from: {', '.join(CACHE_MODES[1:])}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be shared with a forked child
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if self.mode == "record":
+            return None
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        if row is None:
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No recorded LLM response for this prompt (key {key[:12]}) in {self.path}")
+            return None
+        return [loads(generation) for generation in json.loads(zlib.decompress(row[0]))]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self.mode == "replay":
+            return
+        value = zlib.compress(json.dumps([dumps(generation) for generation in return_val]).encode())
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value), time.time()),
+            )
+            self.writes += 1
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "entries": entries,
+                "size_mb": round(size / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+# Cache installed by install_llm_cache, if any
+llm_cache = None
+
+
+def must_propagate(error: Exception) -> bool:
+    """Whether an agent must re-raise an error instead of answering with a fallback.
+
+    A replay that hits an unrecorded prompt, or fails in any other way, no
+    longer matches its recording; a normal-looking answer would hide that.
+    """
+    return isinstance(error, LLMCacheMiss) or (llm_cache is not None and llm_cache.mode == "replay")
+
+
+def install_llm_cache() -> Optional[DiskLLMCache]:
+    """Install the disk cache for all LangChain LLM calls, configured from the environment.
+
+    LLM_CACHE_MODE: off (default), readwrite, record or replay
+    LLM_CACHE_PATH: SQLite file (default llm_cache.sqlite)
+    LLM_CACHE_MAX_MB: size bound before LRU eviction (default 256)
+    """
+    global llm_cache
+    mode = os.getenv("LLM_CACHE_MODE", "off").lower()
+    if mode == "off":
+        return None
+    llm_cache = DiskLLMCache(
+        path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"),
+        mode=mode,
+        max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    )
+    set_llm_cache(llm_cache)
+    print(f"💾 LLM cache enabled ({mode}, {llm_cache.path})")
+    return llm_cache
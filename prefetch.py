@@ -0,0 +1,123 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# Shared by all requests; prefetch work is short and I/O or GIL-releasing (embedding, SQLite)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+# Prefetch of the request whose worker node is currently running
+_active: ContextVar[Optional["SpeculativePrefetch"]] = ContextVar("active_prefetch", default=None)
+
+
+def _normalize(key) -> str:
+    """Match keys that differ only in case, whitespace or trailing punctuation."""
+    return re.sub(r"\s+", " ", str(key)).strip().rstrip("?.!").lower()
+
+
+class PrefetchStats:
+    """Process-wide counters for speculative prefetching."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.saved_seconds = 0.0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "launched": self.launched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+                "hit_rate": round(self.hits / self.launched, 3) if self.launched else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "avg_saved_ms": round(1000 * self.saved_seconds / self.hits, 1) if self.hits else 0.0,
+            }
+
+
+prefetch_stats = PrefetchStats()
+
+
+class SpeculativePrefetch:
+    """Side-effect-free tool work started for one request before routing is decided.
+
+    Each task is registered under a tool name and the key (e.g. the question) it
+    was computed for. A worker that is routed to later gets the result through
+    ``lookup`` if it asks the same tool for the same key; whatever is never used
+    is discarded by ``close`` when the request finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def start(self, name: str, key, compute: Callable):
+        def timed():
+            started = time.perf_counter()
+            return compute(), time.perf_counter() - started
+
+        with self._lock:
+            self._tasks[name] = (_normalize(key), _executor.submit(timed))
+        prefetch_stats.add(launched=1)
+
+    def take(self, name: str, key):
+        """Return (True, result) for a matching prefetch, else (False, None)."""
+        with self._lock:
+            task = self._tasks.get(name)
+            if task is None:
+                return False, None
+            if task[0] != _normalize(key):
+                prefetch_stats.add(misses=1)
+                return False, None
+            del self._tasks[name]
+
+        waited_from = time.perf_counter()
+        try:
+            result, duration = task[1].result()
+        except Exception:
+            prefetch_stats.add(misses=1)
+            return False, None
+        waited = time.perf_counter() - waited_from
+        prefetch_stats.add(hits=1, saved_seconds=max(0.0, duration - waited))
+        return True, result
+
+    def close(self):
+        """Drop everything that was not used by a worker."""
+        with self._lock:
+            tasks, self._tasks = self._tasks, {}
+        for _, future in tasks.values():
+            future.cancel()
+        if tasks:
+            prefetch_stats.add(discarded=len(tasks))
+
+
+@contextmanager
+def activate(prefetch: Optional[SpeculativePrefetch]):
+    """Make a request's prefetched results visible to the tools called inside the block."""
+    token = _active.set(prefetch)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def lookup(name: str, key, compute: Callable):
+    """Return the prefetched result for (name, key) if there is one, else compute it."""
+    prefetch = _active.get()
+    if prefetch is not None:
+        found, result = prefetch.take(name, key)
+        if found:
+            return result
+    return compute()
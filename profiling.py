@@ -0,0 +1,449 @@
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Below this, GC pauses and event loop stalls are noise, not causes of a slow request
+_MIN_GC_PAUSE = 0.001
+_MIN_LOOP_LAG = 0.02
+_LOOP_CHECK_INTERVAL = 0.1
+_MAX_SPANS = 5000
+_MAX_SAMPLES = 100_000
+_MAX_STACK_DEPTH = 128
+
+
+class RequestTrace(BaseCallbackHandler):
+    """Timeline of one request: LangGraph node, LLM and tool spans, plus stack samples if sampled.
+
+    Passed as a LangChain callback handler to graph.stream, so every node,
+    chat model and tool run inside the request reports its start and end.
+    Callbacks run inline in the thread doing the work, which records the
+    thread a span ran on. Span and sample counts are bounded.
+    """
+
+    run_inline = True
+
+    def __init__(self, name: str, sampled: bool = False, reason: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.sampled = sampled
+        self.reason = reason
+        self.wall_started = time.time()
+        self.started = time.perf_counter()
+        self.ended = None
+        self.spans = []
+        self._open = {}
+        self._lock = threading.Lock()
+        self.stacks: Dict[tuple, int] = {}
+        self.samples = []  # (thread name, stack id, weight seconds)
+        self.dropped = 0
+        self.gc_pauses = []
+        self.loop_lags = []
+
+    # ---- spans ----
+
+    def _start(self, run_id, kind: str, name: str, **attributes):
+        with self._lock:
+            if len(self.spans) + len(self._open) >= _MAX_SPANS:
+                self.dropped += 1
+                return
+            self._open[run_id] = {
+                "kind": kind,
+                "name": name,
+                "thread": threading.current_thread().name,
+                "start": time.perf_counter() - self.started,
+                **attributes,
+            }
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **attributes):
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            if span is None:
+                return
+            span["end"] = time.perf_counter() - self.started
+            if error is not None:
+                span["error"] = repr(error)[:200]
+            span.update(attributes)
+            self.spans.append(span)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        # Only graph nodes; the runnables inside a node inherit its langgraph_node metadata
+        if metadata and name and metadata.get("langgraph_node") == name:
+            self._start(run_id, "node", name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "chat model")
+        self._start(run_id, "llm", model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "llm")
+        self._start(run_id, "llm", model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._end(run_id, **{key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # ---- samples ----
+
+    def add_samples(self, stacks, weight: float):
+        with self._lock:
+            for thread, stack in stacks:
+                if len(self.samples) >= _MAX_SAMPLES:
+                    self.dropped += 1
+                    return
+                stack_id = self.stacks.setdefault(stack, len(self.stacks))
+                self.samples.append((thread, stack_id, weight))
+
+    # ---- results ----
+
+    @property
+    def duration(self) -> float:
+        return (self.ended or time.perf_counter()) - self.started
+
+    def summary(self) -> dict:
+        """Totals shown in the trace list, before downloading the full trace."""
+        totals = {}
+        for span in self.spans:
+            key = f"{span['kind']}_ms"
+            totals[key] = totals.get(key, 0.0) + 1000 * (span["end"] - span["start"])
+        return {
+            "id": self.id,
+            "name": self.name,
+            "reason": self.reason,
+            "started": self.wall_started,
+            "duration_ms": round(1000 * self.duration, 1),
+            "spans": len(self.spans),
+            "llm_calls": sum(1 for span in self.spans if span["kind"] == "llm"),
+            **{key: round(value, 1) for key, value in totals.items()},
+            "gc_pause_ms": round(1000 * sum(duration for _, duration, _ in self.gc_pauses), 1),
+            "max_loop_lag_ms": round(1000 * max((lag for _, lag in self.loop_lags), default=0.0), 1),
+            "samples": len(self.samples),
+            "dropped": self.dropped,
+        }
+
+    def to_speedscope(self) -> dict:
+        """The trace in speedscope's file format (https://www.speedscope.app).
+
+        Spans become evented profiles, one per lane of properly nested spans
+        (so per thread, plus extra lanes for overlapping work such as parallel
+        tool calls). GC pauses and event loop stalls get lanes of their own.
+        Stack samples become one sampled profile per thread.
+        """
+        frames, frame_ids = [], {}
+
+        def frame(name, file=None, line=None):
+            key = (name, file, line)
+            if key not in frame_ids:
+                frame_ids[key] = len(frames)
+                entry = {"name": name}
+                if file:
+                    entry["file"] = file
+                    entry["line"] = line
+                frames.append(entry)
+            return frame_ids[key]
+
+        end_ms = 1000 * self.duration
+        profiles = []
+
+        def evented(name, spans):
+            for i, lane in enumerate(_nested_lanes(spans)):
+                events, stack = [], []
+                for start, end, label in lane:
+                    while stack and stack[-1][0] <= start:
+                        at, closed = stack.pop()
+                        events.append({"type": "C", "frame": frame(closed), "at": 1000 * at})
+                    events.append({"type": "O", "frame": frame(label), "at": 1000 * start})
+                    stack.append((end, label))
+                while stack:
+                    at, closed = stack.pop()
+                    events.append({"type": "C", "frame": frame(closed), "at": 1000 * at})
+                profiles.append({
+                    "type": "evented",
+                    "name": name if i == 0 else f"{name} ({i + 1})",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": end_ms,
+                    "events": events,
+                })
+
+        by_thread = {}
+        for span in self.spans:
+            label = f"{span['kind']} {span['name']}"
+            by_thread.setdefault(span["thread"], []).append((span["start"], span["end"], label))
+        for thread, spans in by_thread.items():
+            evented(f"spans: {thread}", spans)
+        if self.gc_pauses:
+            evented("gc pauses", [(start, start + duration, f"gc gen{generation}")
+                                  for start, duration, generation in self.gc_pauses])
+        if self.loop_lags:
+            evented("event loop lag", [(start, start + lag, "event loop blocked") for start, lag in self.loop_lags])
+
+        stack_frames = {
+            stack_id: [frame(name, file, line) for name, file, line in stack]
+            for stack, stack_id in self.stacks.items()
+        }
+        samples_by_thread = {}
+        for thread, stack_id, weight in self.samples:
+            samples, weights = samples_by_thread.setdefault(thread, ([], []))
+            samples.append(stack_frames[stack_id])
+            weights.append(1000 * weight)
+        for thread, (samples, weights) in samples_by_thread.items():
+            profiles.append({
+                "type": "sampled",
+                "name": f"samples: {thread}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.name} ({self.reason}, {1000 * self.duration:.0f} ms)",
+            "exporter": "multi-agent-chatbot profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+def _nested_lanes(spans: List[tuple]) -> List[List[tuple]]:
+    """Split (start, end, label) spans into lanes in which every span nests or follows."""
+    lanes, stacks = [], []
+    for span in sorted(spans, key=lambda span: (span[0], -span[1])):
+        for lane, stack in zip(lanes, stacks):
+            while stack and stack[-1] <= span[0]:
+                stack.pop()
+            if not stack or span[1] <= stack[-1]:
+                lane.append(span)
+                stack.append(span[1])
+                break
+        else:
+            lanes.append([span])
+            stacks.append([span[1]])
+    return lanes
+
+
+class Profiler:
+    """Production request profiling: always-on span capture, on-demand stack sampling.
+
+    Every traced request records its spans, which costs a few microseconds
+    per node, LLM or tool call. GC pauses (via gc.callbacks) and event loop
+    stalls (a 100 ms heartbeat task) are recorded process-wide into bounded
+    deques and attached to a trace for its time window. A finished trace is
+    kept in a ring buffer of ``max_traces`` if it took longer than
+    ``slow_threshold`` seconds or was explicitly sampled; otherwise it is
+    dropped.
+
+    The stack sampler walks ``sys._current_frames()`` every
+    ``sample_interval`` seconds, but only while a sampled request is running:
+    one sent with profiling requested, or any request during a profiling
+    window. Samples cover all threads of the process for the request's
+    duration, so concurrent requests show up in each other's samples.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        slow_threshold: float = 10.0,
+        max_traces: int = 20,
+        sample_interval: float = 0.01,
+    ):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.sample_interval = sample_interval
+        self.traces = deque(maxlen=max_traces)
+        self.window_until = 0.0
+        self._lock = threading.Lock()
+        self._sampling = set()
+        self._sampler = None
+        self._gc_started = None
+        self._gc_pauses = deque(maxlen=2000)
+        self._loop_lags = deque(maxlen=2000)
+        self._loop_monitor = None
+        self.requests = 0
+        self.captured = 0
+
+    # ---- process-wide monitors ----
+
+    def install(self):
+        """Start the GC pause hook and the event loop lag monitor; call from the running event loop."""
+        if not self.enabled:
+            return
+        if self._on_gc not in gc.callbacks:
+            gc.callbacks.append(self._on_gc)
+        if self._loop_monitor is None:
+            self._loop_monitor = asyncio.get_running_loop().create_task(self._monitor_loop())
+
+    def uninstall(self):
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self._loop_monitor is not None:
+            self._loop_monitor.cancel()
+            self._loop_monitor = None
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            duration = time.perf_counter() - self._gc_started
+            if duration >= _MIN_GC_PAUSE:
+                self._gc_pauses.append((self._gc_started, duration, info.get("generation")))
+            self._gc_started = None
+
+    async def _monitor_loop(self):
+        while True:
+            expected = time.perf_counter() + _LOOP_CHECK_INTERVAL
+            await asyncio.sleep(_LOOP_CHECK_INTERVAL)
+            lag = time.perf_counter() - expected
+            if lag >= _MIN_LOOP_LAG:
+                self._loop_lags.append((expected, lag))
+
+    # ---- sampling ----
+
+    def start_window(self, seconds: float):
+        """Sample and keep every request that starts in the next ``seconds``."""
+        self.window_until = time.time() + seconds
+
+    def window_remaining(self) -> float:
+        return max(0.0, self.window_until - time.time())
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                traces = list(self._sampling)
+                if not traces:
+                    self._sampler = None
+                    return
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks.append((names.get(ident, str(ident)), tuple(stack)))
+            for trace in traces:
+                trace.add_samples(stacks, now - last)
+            last = now
+            time.sleep(self.sample_interval)
+
+    # ---- traces ----
+
+    def start_trace(self, name: str, sample: bool = False) -> Optional[RequestTrace]:
+        """Begin tracing a request; returns None when profiling is disabled."""
+        if not self.enabled:
+            return None
+        self.requests += 1
+        if sample:
+            reason = "requested"
+        elif self.window_remaining() > 0:
+            reason, sample = "window", True
+        else:
+            reason = None
+        trace = RequestTrace(name, sampled=sample, reason=reason)
+        if sample:
+            with self._lock:
+                self._sampling.add(trace)
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                    self._sampler.start()
+        return trace
+
+    def finish(self, trace: Optional[RequestTrace]) -> bool:
+        """Keep the trace if it was sampled or slow, with the GC pauses and loop stalls of its window."""
+        if trace is None:
+            return False
+        with self._lock:
+            self._sampling.discard(trace)
+        trace.ended = time.perf_counter()
+        if not trace.sampled:
+            if trace.duration < self.slow_threshold:
+                return False
+            trace.reason = "slow"
+
+        # Leftover open spans (e.g. a tool interrupted by an error) end with the request
+        with trace._lock:
+            for span in trace._open.values():
+                trace.spans.append({**span, "end": trace.ended - trace.started, "error": "unfinished"})
+            trace._open.clear()
+        trace.gc_pauses = [
+            (start - trace.started, duration, generation)
+            for start, duration, generation in list(self._gc_pauses)
+            if trace.started <= start <= trace.ended
+        ]
+        trace.loop_lags = [
+            (start - trace.started, lag)
+            for start, lag in list(self._loop_lags)
+            if trace.started <= start + lag and start <= trace.ended
+        ]
+        self.traces.append(trace)
+        self.captured += 1
+        return True
+
+    def clear(self):
+        self.traces.clear()
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        for trace in list(self.traces):
+            if trace.id == trace_id:
+                return trace
+        return None
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "slow_threshold_ms": round(1000 * self.slow_threshold),
+            "sample_interval_ms": round(1000 * self.sample_interval, 1),
+            "window_remaining_s": round(self.window_remaining(), 1),
+            "sampling_requests": len(self._sampling),
+            "requests": self.requests,
+            "captured": self.captured,
+            "buffer_size": self.traces.maxlen,
+            "traces": [trace.summary() for trace in reversed(self.traces)],
+        }
+
+
+# Shared by the API and its admin endpoints, configured from the environment:
+# PROFILING (default true), PROFILE_SLOW_MS (default 10000),
+# PROFILE_TRACE_BUFFER (default 20), PROFILE_SAMPLE_MS (default 10)
+profiler = Profiler(
+    enabled=os.getenv("PROFILING", "true").lower() in ("1", "true", "yes"),
+    slow_threshold=float(os.getenv("PROFILE_SLOW_MS", "10000")) / 1000,
+    max_traces=int(os.getenv("PROFILE_TRACE_BUFFER", "20")),
+    sample_interval=float(os.getenv("PROFILE_SAMPLE_MS", "10")) / 1000,
+)
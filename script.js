@@ -5,6 +5,8 @@ const AGENT_MAPPING = {
     'rag': 'rag-badge',
     'nl2sql': 'sql-badge'
 };
+// Rows per page of a SQL result table
+const SQL_PAGE_SIZE = 25;
 
 // Global state
 let currentSessionId = null;
@@ -115,7 +117,10 @@ async function sendMessage(message) {
         highlightActiveAgents(data.agents_used);
         
         // Add assistant response
-        addMessage('assistant', data.response, data.agents_used, data.timestamp);
+        const messageDiv = addMessage('assistant', data.response, data.agents_used, data.timestamp);
+        
+        // Full SQL results are loaded page by page from the server, not sent with the reply
+        (data.sql_results || []).forEach(resultId => addSqlResultTable(messageDiv, resultId));
         
     } catch (error) {
         console.error('Error sending message:', error);
@@ -193,6 +198,92 @@ function addMessage(role, content, agentsUsed = [], timestamp = null, isError =
     
     chatMessages.appendChild(messageDiv);
     scrollToBottom();
+    return messageDiv;
+}
+
+function addSqlResultTable(messageDiv, resultId) {
+    const container = document.createElement('div');
+    container.className = 'sql-result';
+    messageDiv.querySelector('.message-bubble').after(container);
+    loadSqlResultPage(container, resultId, 0);
+}
+
+async function loadSqlResultPage(container, resultId, offset) {
+    try {
+        const response = await fetch(
+            `${API_BASE_URL}/sql-results/${resultId}?offset=${offset}&limit=${SQL_PAGE_SIZE}`
+        );
+        
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        renderSqlResultPage(container, await response.json());
+    } catch (error) {
+        console.error('Error loading SQL result:', error);
+        container.textContent = 'The full query result is no longer available.';
+    }
+}
+
+function renderSqlResultPage(container, data) {
+    container.innerHTML = '';
+    
+    const tableWrapper = document.createElement('div');
+    tableWrapper.className = 'sql-table-wrapper';
+    
+    const table = document.createElement('table');
+    table.className = 'sql-table';
+    
+    const headerRow = table.createTHead().insertRow();
+    data.columns.forEach(column => {
+        const th = document.createElement('th');
+        th.textContent = column;
+        headerRow.appendChild(th);
+    });
+    
+    const body = table.createTBody();
+    data.rows.forEach(row => {
+        const tr = body.insertRow();
+        row.forEach(value => {
+            tr.insertCell().textContent = value;
+        });
+    });
+    
+    tableWrapper.appendChild(table);
+    container.appendChild(tableWrapper);
+    
+    // Pager: previous/next page, position and a CSV download of the whole result
+    const pager = document.createElement('div');
+    pager.className = 'sql-pager';
+    
+    const prevButton = document.createElement('button');
+    prevButton.innerHTML = '<i class="fas fa-chevron-left"></i>';
+    prevButton.disabled = data.offset === 0;
+    prevButton.addEventListener('click', () => {
+        loadSqlResultPage(container, data.result_id, Math.max(0, data.offset - SQL_PAGE_SIZE));
+    });
+    
+    const position = document.createElement('span');
+    const first = data.rows.length ? data.offset + 1 : 0;
+    const last = data.offset + data.rows.length;
+    position.textContent = `Rows ${first}-${last} of ${data.row_count}${data.truncated ? ' (truncated)' : ''}`;
+    
+    const nextButton = document.createElement('button');
+    nextButton.innerHTML = '<i class="fas fa-chevron-right"></i>';
+    nextButton.disabled = last >= data.row_count;
+    nextButton.addEventListener('click', () => {
+        loadSqlResultPage(container, data.result_id, data.offset + SQL_PAGE_SIZE);
+    });
+    
+    const download = document.createElement('a');
+    download.href = `${API_BASE_URL}/sql-results/${data.result_id}/csv`;
+    download.innerHTML = '<i class="fas fa-download"></i> CSV';
+    
+    pager.appendChild(prevButton);
+    pager.appendChild(position);
+    pager.appendChild(nextButton);
+    pager.appendChild(download);
+    container.appendChild(pager);
 }
 
 function formatTime(isoString) {
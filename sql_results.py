@@ -0,0 +1,247 @@
+import csv
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Iterable, Sequence
+
+# Rows between seek points in a result's index, so any page is read without scanning the file
+_SEEK_EVERY = 1000
+_RESULT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _preview_value(value, max_chars: int):
+    """JSON-friendly cell for the LLM preview, with long text cut short."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+
+def _is_number(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    # Decimal and numpy scalars from other drivers
+    return hasattr(value, "__float__") and not isinstance(value, str)
+
+
+class _ColumnStats:
+    """Running count/null/min/max/sum of one column, kept while numeric values stream past."""
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.numeric = True
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+
+    def add(self, value):
+        if value is None:
+            self.nulls += 1
+            return
+        self.count += 1
+        if not self.numeric:
+            return
+        if not _is_number(value):
+            self.numeric = False
+            return
+        value = float(value)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sum += value
+
+    def summary(self) -> dict:
+        summary = {"count": self.count, "nulls": self.nulls}
+        if self.numeric and self.count:
+            summary.update(
+                min=self.min,
+                max=self.max,
+                sum=round(self.sum, 6),
+                mean=round(self.sum / self.count, 6),
+            )
+        return summary
+
+
+class SQLResultStore:
+    """Full SQL result sets on disk, summarized for the LLM and paged for the UI.
+
+    ``save`` streams the rows of a query into ``<result_id>.csv`` and returns
+    what the agent needs: column names, row count, a preview of the first
+    ``preview_rows`` rows and per-column aggregates (count, nulls and, for
+    numeric columns, min/max/sum/mean). The preview is all that reaches the
+    LLM context, however large the result.
+
+    Next to the CSV, ``<result_id>.json`` holds the columns, row count, query
+    and seek positions every 1000 rows, so ``page`` reads any offset without
+    scanning the file. Files live in a directory shared by all server
+    workers; once it exceeds ``max_bytes``, the oldest results are removed.
+    At most ``max_rows`` rows are kept per result.
+    """
+
+    def __init__(
+        self,
+        directory: str = "sql_results",
+        max_bytes: int = 100 * 1024 * 1024,
+        max_rows: int = 1_000_000,
+        preview_rows: int = 20,
+        max_cell_chars: int = 100,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.preview_rows = preview_rows
+        self.max_cell_chars = max_cell_chars
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, result_id: str, extension: str) -> str:
+        if not _RESULT_ID.match(result_id):
+            raise KeyError(result_id)
+        return os.path.join(self.directory, f"{result_id}.{extension}")
+
+    def csv_path(self, result_id: str) -> str:
+        path = self._path(result_id, "csv")
+        if not os.path.exists(path):
+            raise KeyError(result_id)
+        return path
+
+    def exists(self, result_id: str) -> bool:
+        try:
+            self.csv_path(result_id)
+            return True
+        except KeyError:
+            return False
+
+    def save(self, columns: Sequence[str], rows: Iterable[Sequence], query: str = "") -> dict:
+        """Write rows to disk and return the summary shown to the LLM."""
+        result_id = uuid.uuid4().hex
+        columns = [str(column) for column in columns]
+        stats = [_ColumnStats() for _ in columns]
+        preview = []
+        seek_points = []
+        row_count = 0
+        truncated = False
+
+        csv_path = self._path(result_id, "csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                if row_count == self.max_rows:
+                    truncated = True
+                    break
+                if row_count % _SEEK_EVERY == 0:
+                    seek_points.append(f.tell())
+                writer.writerow(row)
+                for column_stats, value in zip(stats, row):
+                    column_stats.add(value)
+                if row_count < self.preview_rows:
+                    preview.append([_preview_value(value, self.max_cell_chars) for value in row])
+                row_count += 1
+
+        with open(self._path(result_id, "json"), "w") as f:
+            json.dump({
+                "columns": columns,
+                "row_count": row_count,
+                "truncated": truncated,
+                "query": query,
+                "created": time.time(),
+                "seek_points": seek_points,
+            }, f)
+        self._evict(keep=result_id)
+
+        return {
+            "result_id": result_id,
+            "columns": columns,
+            "row_count": row_count,
+            "truncated": truncated,
+            "preview": preview,
+            "aggregates": {column: column_stats.summary() for column, column_stats in zip(columns, stats)},
+        }
+
+    def page(self, result_id: str, offset: int = 0, limit: int = 50) -> dict:
+        """Rows [offset, offset + limit) of a stored result; values come back as strings."""
+        csv_path = self.csv_path(result_id)
+        with open(self._path(result_id, "json")) as f:
+            meta = json.load(f)
+
+        rows = []
+        if 0 <= offset < meta["row_count"] and limit > 0:
+            block, skip = divmod(offset, _SEEK_EVERY)
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                f.seek(meta["seek_points"][block])
+                for i, row in enumerate(csv.reader(f)):
+                    if i < skip:
+                        continue
+                    rows.append(row)
+                    if len(rows) == limit:
+                        break
+
+        return {
+            "result_id": result_id,
+            "columns": meta["columns"],
+            "row_count": meta["row_count"],
+            "truncated": meta["truncated"],
+            "query": meta["query"],
+            "offset": offset,
+            "limit": limit,
+            "rows": rows,
+        }
+
+    def _evict(self, keep: str):
+        """Remove the oldest results until the directory is back under max_bytes.
+
+        The result just saved is kept even if it alone exceeds the bound, so the
+        id handed to the agent always resolves.
+        """
+        with self._lock:
+            results = {}
+            for entry in os.scandir(self.directory):
+                result_id, _, extension = entry.name.partition(".")
+                if extension in ("csv", "json") and _RESULT_ID.match(result_id):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # removed by another worker
+                        continue
+                    size, created = results.get(result_id, (0, stat.st_mtime))
+                    results[result_id] = (size + stat.st_size, min(created, stat.st_mtime))
+
+            total = sum(size for size, _ in results.values())
+            for result_id, (size, _) in sorted(results.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                if result_id == keep:
+                    continue
+                for extension in ("csv", "json"):
+                    try:
+                        os.remove(os.path.join(self.directory, f"{result_id}.{extension}"))
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+
+def execute(engine, query: str, store: SQLResultStore) -> dict:
+    """Run a query with SQLAlchemy and stream its rows into the store."""
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        # stream_results fetches rows in chunks instead of buffering the whole result
+        result = connection.execution_options(stream_results=True).execute(text(query))
+        if not result.returns_rows:
+            connection.commit()
+            return store.save(["rows_affected"], [[result.rowcount]], query)
+        return store.save(list(result.keys()), result, query)
+
+
+# Shared by the SQL agent and the API, configured from the environment
+sql_result_store = SQLResultStore(
+    directory=os.getenv("SQL_RESULTS_DIR", "sql_results"),
+    max_bytes=int(float(os.getenv("SQL_RESULTS_MAX_MB", "100")) * 1024 * 1024),
+    max_rows=int(os.getenv("SQL_RESULT_MAX_ROWS", "1000000")),
+    preview_rows=int(os.getenv("SQL_PREVIEW_ROWS", "20")),
+)
@@ -0,0 +1,604 @@
+"""Vector store backends for the RAG agent.
+
+``VectorStore`` is the small interface RAG_Agent needs: upsert precomputed
+embeddings, delete, list a file's chunks and search with an optional filter on
+file name and page. Two backends implement it:
+
+- ``ChromaVectorStore``: the existing Chroma collection (default)
+- ``HNSWVectorStore``: a local HNSW index (usearch) whose graph and float16/float32
+  vectors live in one file that is memory-mapped for serving, with chunk text and
+  metadata in SQLite. RSS stays flat as the corpus grows to millions of chunks and
+  forked workers share the mapped pages through the OS page cache.
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+
+def _groups(items: list, size: int = 900) -> List[list]:
+    """Split SQL parameter lists below SQLite's bound-variable limit."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class _IndexedFiles:
+    """Completion markers: the signature and chunk count each source was fully indexed with.
+
+    A marker is written only after all chunks of a file are upserted, its stale
+    chunks deleted and the store flushed, so a file whose ingestion was
+    interrupted never looks current.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS indexed_files ("
+                "source TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, chunks INTEGER NOT NULL)"
+            )
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def all(self) -> Dict[str, Tuple[Tuple[int, int], int]]:
+        with self._lock:
+            rows = self._connection().execute("SELECT source, mtime_ns, size, chunks FROM indexed_files").fetchall()
+        return {source: ((mtime_ns, size), chunks) for source, mtime_ns, size, chunks in rows}
+
+    def mark(self, source: str, signature: Tuple[int, int], chunk_count: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_files (source, mtime_ns, size, chunks) VALUES (?, ?, ?, ?)",
+                (source, signature[0], signature[1], chunk_count),
+            )
+            conn.commit()
+
+    def unmark(self, source: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM indexed_files WHERE source = ?", (source,))
+            conn.commit()
+
+
+class VectorStore(ABC):
+    """Storage and similarity search for embedded document chunks."""
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[dict]):
+        """Insert chunks, replacing any with the same id."""
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """Remove chunks by id."""
+
+    @abstractmethod
+    def ids_for_source(self, source: str) -> List[str]:
+        """Ids of every chunk that came from the given file path."""
+
+    @abstractmethod
+    def chunk_counts(self) -> Dict[str, int]:
+        """Number of stored chunks per source."""
+
+    @abstractmethod
+    def search(
+        self, embedding: List[float], k: int, file: Optional[str] = None, page: Optional[int] = None
+    ) -> List[Tuple[Document, float]]:
+        """The k nearest chunks with their distance (lower is closer), optionally
+        restricted to one file name and/or page."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of chunks in the store."""
+
+    def flush(self):
+        """Make pending writes durable; called after bulk ingestion."""
+
+    def mark_indexed(self, source: str, signature: Tuple[int, int], chunk_count: int):
+        """Record that a file is fully indexed; call after its chunks are upserted and flushed."""
+        self._indexed_files.mark(source, signature, chunk_count)
+
+    def unmark_indexed(self, source: str):
+        """Forget a file's completion marker, e.g. when it was deleted or failed to load."""
+        self._indexed_files.unmark(source)
+
+    def file_signatures(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        """Stored sources with the (mtime_ns, size) they were completely indexed with.
+
+        A source maps to None when it has chunks but no completion marker, or
+        its marker's chunk count does not match the chunks actually stored.
+        """
+        counts = self.chunk_counts()
+        signatures = {source: None for source in counts}
+        for source, (signature, chunk_count) in self._indexed_files.all().items():
+            if counts.get(source, 0) == chunk_count:
+                signatures[source] = signature
+        return signatures
+
+    def reopen(self):
+        """Recreate process-local handles after fork()."""
+
+    def refresh(self):
+        """Pick up writes made by another process."""
+        self.reopen()
+
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore on a langchain_chroma collection."""
+
+    def __init__(self, collection_name: str, embedding_function, persist_directory: str):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self._pid = None
+        self.reopen()
+        self._indexed_files = _IndexedFiles(os.path.join(persist_directory, f"{collection_name}_files.sqlite"))
+
+    def reopen(self, force: bool = False):
+        # Imported here so the HNSW backend does not require chromadb
+        from langchain_chroma import Chroma
+        from chromadb.api.client import SharedSystemClient
+
+        if force or (self._pid is not None and self._pid != os.getpid()):
+            # chromadb caches one System (SQLite connections, segment state) per persist
+            # path; a forked child would otherwise get the parent's back from Chroma()
+            SharedSystemClient.clear_system_cache()
+        self._pid = os.getpid()
+        self.store = Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self.embedding_function,
+            persist_directory=self.persist_directory
+        )
+
+    def upsert(self, ids, embeddings, texts, metadatas):
+        self.store._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+    def delete(self, ids):
+        for group in _groups(ids):
+            self.store.delete(ids=group)
+
+    def ids_for_source(self, source):
+        return self.store.get(where={"source": source}, include=[])["ids"]
+
+    def chunk_counts(self):
+        counts, offset, page_size = {}, 0, 10000
+        while True:
+            metadatas = self.store.get(include=["metadatas"], limit=page_size, offset=offset)["metadatas"]
+            for metadata in metadatas:
+                source = (metadata or {}).get("source")
+                counts[source] = counts.get(source, 0) + 1
+            if len(metadatas) < page_size:
+                return counts
+            offset += page_size
+
+    def search(self, embedding, k, file=None, page=None):
+        conditions = [{key: value} for key, value in (("file", file), ("page", page)) if value is not None]
+        where = None
+        if len(conditions) == 1:
+            where = conditions[0]
+        elif conditions:
+            where = {"$and": conditions}
+        return self.store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+
+    def count(self):
+        return self.store._collection.count()
+
+    def refresh(self):
+        # The cached System keeps serving this process's in-memory segments
+        self.reopen(force=True)
+
+
+class HNSWVectorStore(VectorStore):
+    """HNSW index over a memory-mapped vector file, with metadata in SQLite.
+
+    Layout of ``directory``:
+    - ``index.usearch``: HNSW graph and vectors, opened as a read-only memory map
+    - ``delta.usearch``: chunks added since the last compaction, a small index
+      mapped next to the base one
+    - ``meta.sqlite``: integer key -> chunk id, file, page, text and metadata, the
+      completion marker of each indexed file and the highest flushed key
+
+    The mapped index cannot be modified in place. New or replaced chunks go to
+    the delta index, held in memory by the writer and searched alongside the
+    base; removed chunks disappear from SQLite and are filtered out of results.
+    Upserting a chunk whose text is unchanged only updates its metadata row and
+    keeps its key and vector. ``flush`` saves the delta file, which costs as much
+    as the delta is large. Only when the delta reaches ``compact_threshold``
+    vectors, or dead keys exceed ``compact_dead_ratio`` of the stored vectors,
+    does it restore the whole index into memory and write a new base file
+    without them. Files are renamed into place, so readers switch atomically.
+
+    Rows are committed to SQLite before their vectors are flushed. Rows above
+    the highest flushed key belong to a writer that was killed before its
+    flush; the next writer deletes them before its first write, and compaction
+    deletes any row whose key has no vector.
+
+    Tuning: ``connectivity`` (M) and ``expansion_add`` (ef_construction) trade
+    build time and index size for recall; ``expansion_search`` (ef) trades query
+    latency for recall and can be changed at any time. ``dtype`` "f16" halves
+    the vector file compared to "f32" at a negligible recall cost.
+
+    Filters on file and page are resolved in SQLite first: when at most
+    ``exact_filter_limit`` chunks match, their vectors are scored exactly;
+    broader filters over-fetch from the graph and filter the candidates.
+
+    Writes assume a single writer process; with several server workers, only
+    one of them should run the document watcher against the same directory.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: str = "f16",
+        connectivity: int = 16,
+        expansion_add: int = 128,
+        expansion_search: int = 64,
+        exact_filter_limit: int = 20000,
+        compact_threshold: int = 50000,
+        compact_dead_ratio: float = 0.2,
+    ):
+        # Optional dependency, only needed for this backend
+        from usearch.index import Index
+
+        self._Index = Index
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.usearch")
+        self.delta_path = os.path.join(directory, "delta.usearch")
+        self.meta_path = os.path.join(directory, "meta.sqlite")
+        self.dtype = dtype
+        self.connectivity = connectivity
+        self.expansion_add = expansion_add
+        self.expansion_search = expansion_search
+        self.exact_filter_limit = exact_filter_limit
+        self.compact_threshold = compact_threshold
+        self.compact_dead_ratio = compact_dead_ratio
+        os.makedirs(directory, exist_ok=True)
+
+        # _write_lock serializes writers (upsert, delete, compaction); _lock is only held
+        # briefly around SQLite access, delta index access and swapping index references
+        self._write_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self.ndim = None
+        self._indexed_files = _IndexedFiles(self.meta_path)
+        self._base, self._delta = self._open_views()
+        # Set in the process that writes: its delta is writable and newer than the file
+        self._writer_pid = None
+        self._delta_dirty = False
+
+    # ---- storage helpers ----
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.meta_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "key INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, source TEXT, "
+                "file TEXT, page INTEGER, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_file_page ON chunks (file, page)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Stores written before this key existed had every row flushed
+            self._conn.execute(
+                "INSERT OR IGNORE INTO state (name, value) "
+                "SELECT 'flushed_key', COALESCE(MAX(key), 0) FROM chunks"
+            )
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _new_index(self):
+        return self._Index(
+            ndim=self.ndim,
+            metric="ip",  # the multi-qa *-dot-v1 models are trained for dot-product scoring
+            dtype=self.dtype,
+            connectivity=self.connectivity,
+            expansion_add=self.expansion_add,
+            expansion_search=self.expansion_search,
+        )
+
+    def _open_view(self, path):
+        index = self._Index.restore(path, view=True)
+        index.expansion_search = self.expansion_search
+        return index
+
+    def _open_views(self):
+        """Map the base and delta index files as they are on disk."""
+        base = self._open_view(self.index_path) if os.path.exists(self.index_path) else None
+        delta = self._open_view(self.delta_path) if os.path.exists(self.delta_path) else None
+        for index in (base, delta):
+            if index is not None:
+                self.ndim = index.ndim
+        return base, delta
+
+    def _begin_write(self, conn):
+        """Become this process's writer, once: drop rows a killed writer never
+        flushed and load the delta as a writable in-memory index."""
+        if self._writer_pid == os.getpid():
+            return
+        flushed_key = conn.execute("SELECT value FROM state WHERE name = 'flushed_key'").fetchone()[0]
+        conn.execute("DELETE FROM chunks WHERE key > ?", (flushed_key,))
+        conn.commit()
+        self._delta = None
+        if os.path.exists(self.delta_path):
+            self._delta = self._Index.restore(self.delta_path)
+            self._delta.expansion_search = self.expansion_search
+        self._delta_dirty = False
+        self._writer_pid = os.getpid()
+
+    def reopen(self):
+        # The memory maps are read-only and safe to share; SQLite reconnects lazily per process
+        self._pid = None
+
+    def refresh(self):
+        # SQLite already sees committed rows; map the files another process flushed.
+        # The writer's own delta is never older than the one on disk
+        if self._writer_pid == os.getpid():
+            return
+        base, delta = self._open_views()
+        with self._lock:
+            self._base, self._delta = base, delta
+
+    # ---- VectorStore ----
+
+    def upsert(self, ids, embeddings, texts, metadatas):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._write_lock, self._lock:
+            if self.ndim is None:
+                self.ndim = vectors.shape[1]
+            conn = self._connection()
+            self._begin_write(conn)
+            stored_texts = {}
+            for group in _groups(list(ids)):
+                placeholders = ",".join("?" * len(group))
+                stored_texts.update(conn.execute(f"SELECT id, text FROM chunks WHERE id IN ({placeholders})", group))
+
+            # Same model and same text means the same vector: keep the key, refresh the metadata
+            added = [i for i, chunk_id in enumerate(ids) if stored_texts.get(chunk_id) != texts[i]]
+            conn.executemany(
+                "UPDATE chunks SET source = ?, file = ?, page = ?, metadata = ? WHERE id = ?",
+                [(metadatas[i].get("source"), metadatas[i].get("file"), metadatas[i].get("page"),
+                  json.dumps(metadatas[i], default=str), chunk_id)
+                 for i, chunk_id in enumerate(ids) if stored_texts.get(chunk_id) == texts[i]],
+            )
+            if added:
+                self._delete_locked(conn, [ids[i] for i in added if ids[i] in stored_texts])
+                keys = []
+                for i in added:
+                    cursor = conn.execute(
+                        "INSERT INTO chunks (id, source, file, page, text, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                        (ids[i], metadatas[i].get("source"), metadatas[i].get("file"), metadatas[i].get("page"),
+                         texts[i], json.dumps(metadatas[i], default=str)),
+                    )
+                    keys.append(cursor.lastrowid)
+                if self._delta is None:
+                    self._delta = self._new_index()
+                self._delta.add(np.asarray(keys, dtype=np.uint64), vectors[added])
+                self._delta_dirty = True
+            conn.commit()
+
+    def _delete_locked(self, conn, ids):
+        keys = []
+        # Stay under SQLite's limit on bound parameters per statement
+        for group in _groups(list(ids)):
+            placeholders = ",".join("?" * len(group))
+            keys.extend(row[0] for row in conn.execute(f"SELECT key FROM chunks WHERE id IN ({placeholders})", group))
+            conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", group)
+        if not keys:
+            return
+        # Keys in the mapped base index stay in the graph until the next compaction;
+        # without a metadata row they are dropped from search results
+        if self._delta is not None:
+            in_delta = [key for key in keys if key in self._delta]
+            if in_delta:
+                self._delta.remove(np.asarray(in_delta, dtype=np.uint64))
+                self._delta_dirty = True
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._write_lock, self._lock:
+            conn = self._connection()
+            self._begin_write(conn)
+            self._delete_locked(conn, list(ids))
+            conn.commit()
+
+    def ids_for_source(self, source):
+        with self._lock:
+            return [row[0] for row in self._connection().execute("SELECT id FROM chunks WHERE source = ?", (source,))]
+
+    def chunk_counts(self):
+        with self._lock:
+            return dict(self._connection().execute("SELECT source, COUNT(*) FROM chunks GROUP BY source"))
+
+    def search(self, embedding, k, file=None, page=None):
+        query = np.asarray(embedding, dtype=np.float32)
+        if file is not None or page is not None:
+            keys = self._filtered_keys(file, page, limit=self.exact_filter_limit + 1)
+            if len(keys) <= self.exact_filter_limit:
+                return self._exact_search(query, keys, k)
+
+        with self._lock:
+            base, delta = self._base, self._delta
+        total = (len(base) if base is not None else 0) + (len(delta) if delta is not None else 0)
+
+        # Over-fetch to make room for deleted and filtered-out chunks, widening until k survive
+        count = k * (4 if file is None and page is None else 32)
+        while True:
+            candidates = self._approximate(base, query, count)
+            with self._lock:
+                # The delta index is mutated in place by writers, so search it under the lock
+                candidates += self._approximate(self._delta, query, count)
+            results = self._resolve(candidates, k, file, page)
+            if len(results) >= k or count >= total:
+                return results
+            count *= 4
+
+    @staticmethod
+    def _approximate(index, query, count):
+        if index is None or len(index) == 0:
+            return []
+        found = index.search(query, count)
+        return list(zip(found.keys.tolist(), found.distances.tolist()))
+
+    def _filtered_keys(self, file, page, limit):
+        conditions, params = [], []
+        if file is not None:
+            conditions.append("file = ?")
+            params.append(file)
+        if page is not None:
+            conditions.append("page = ?")
+            params.append(page)
+        sql = f"SELECT key FROM chunks WHERE {' AND '.join(conditions)} LIMIT ?"
+        with self._lock:
+            return [row[0] for row in self._connection().execute(sql, params + [limit])]
+
+    def _exact_search(self, query, keys, k):
+        """Exact search over a small filtered subset (e.g. one file), reading its vectors from the index."""
+        if not keys:
+            return []
+        keys_array = np.asarray(keys, dtype=np.uint64)
+        with self._lock:
+            base, delta = self._base, self._delta
+            from_delta = delta.get(keys_array, dtype=np.float32) if delta is not None else [None] * len(keys)
+        from_base = base.get(keys_array, dtype=np.float32) if base is not None else [None] * len(keys)
+
+        candidates = []
+        for key, in_delta, in_base in zip(keys, from_delta, from_base):
+            vector = in_delta if in_delta is not None else in_base
+            if vector is not None:
+                # Same distance as the "ip" metric of the index
+                candidates.append((key, 1.0 - float(np.dot(query, vector))))
+        return self._resolve(candidates, k, None, None)
+
+    def _resolve(self, candidates, k, file, page):
+        """Look up metadata for candidate keys, apply filters and keep the k closest."""
+        candidates.sort(key=lambda match: match[1])
+        distances = {}
+        for key, distance in candidates:
+            distances.setdefault(key, distance)
+
+        rows = []
+        filters, filter_params = "", []
+        if file is not None:
+            filters += " AND file = ?"
+            filter_params.append(file)
+        if page is not None:
+            filters += " AND page = ?"
+            filter_params.append(page)
+        with self._lock:
+            conn = self._connection()
+            for group in _groups(list(distances)):
+                sql = f"SELECT key, text, metadata FROM chunks WHERE key IN ({','.join('?' * len(group))}){filters}"
+                rows.extend(conn.execute(sql, group + filter_params).fetchall())
+
+        rows.sort(key=lambda row: distances[row[0]])
+        return [
+            (Document(page_content=text, metadata=json.loads(metadata)), distances[key])
+            for key, text, metadata in rows[:k]
+        ]
+
+    def count(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                conn = self._connection()
+                self._begin_write(conn)
+                live = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+                max_key = conn.execute("SELECT COALESCE(MAX(key), 0) FROM chunks").fetchone()[0]
+                base, delta = self._base, self._delta
+            delta_size = len(delta) if delta is not None else 0
+            stored = (len(base) if base is not None else 0) + delta_size
+            # Every live row has a vector, so the rest of the stored vectors are dead keys
+            dead = max(stored - live, 0)
+            if delta_size >= self.compact_threshold or dead > self.compact_dead_ratio * stored:
+                self._compact()
+            elif self._delta_dirty:
+                self._save_delta()
+            with self._lock:
+                conn.execute("UPDATE state SET value = ? WHERE name = 'flushed_key'", (max_key,))
+                conn.commit()
+
+    def _save_delta(self):
+        """Write the delta index next to the base one, replacing the previous delta file."""
+        with self._lock:
+            delta = self._delta
+            if delta is not None and len(delta):
+                tmp_path = self.delta_path + ".tmp"
+                delta.save(tmp_path)
+                os.replace(tmp_path, self.delta_path)
+            elif os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+            self._delta_dirty = False
+
+    def _compact(self):
+        """Merge base and delta into a new index file without dead keys and swap the memory map over to it.
+
+        Runs with the write lock held, so the delta cannot change underneath it;
+        searches keep using the current base and delta until the final swap.
+        Rows whose key has no vector in either index are deleted, so SQLite and
+        the index agree again.
+        """
+        with self._lock:
+            live = {row[0] for row in self._connection().execute("SELECT key FROM chunks")}
+            base, delta = self._base, self._delta
+
+        if base is not None:
+            merged = self._Index.restore(self.index_path)  # writable in-memory copy
+            if delta is not None and len(delta):
+                keys = np.asarray(delta.keys, dtype=np.uint64)
+                # A compaction killed before removing the delta file leaves its keys in both
+                keys = keys[~np.asarray(merged.contains(keys), dtype=bool)]
+                if len(keys):
+                    merged.add(keys, np.vstack(delta.get(keys, dtype=np.float32)))
+        else:
+            # First build: the delta graph already is the whole index, no need to insert twice
+            merged = delta
+        if merged is None:
+            return
+
+        stored = np.asarray(merged.keys).tolist()
+        dead = [key for key in stored if key not in live]
+        if dead:
+            merged.remove(np.asarray(dead, dtype=np.uint64))
+        missing = live.difference(stored)
+        if missing:
+            with self._lock:
+                conn = self._connection()
+                for group in _groups(list(missing)):
+                    conn.execute(f"DELETE FROM chunks WHERE key IN ({','.join('?' * len(group))})", group)
+                conn.commit()
+
+        tmp_path = self.index_path + ".tmp"
+        merged.save(tmp_path)
+        del merged
+        # Searches still holding the old maps keep reading the old (unlinked) files
+        os.replace(tmp_path, self.index_path)
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+        view = self._open_view(self.index_path)
+        with self._lock:
+            self._base = view
+            self._delta = None
+            self._delta_dirty = False